@@ -38,10 +38,12 @@ Options:
     --restart=<file>           Restart from checkpoint file
     --overwrite                If flagged, force file mode to overwrite
     --seed=<seed>              RNG seed for initial conditoins [default: 42]
+    --local_noise              Draw initial noise per-process (no global grid, but depends on core count)
 
     --label=<label>            Optional additional case name label
     --verbose                  Do verbose output (e.g., sparsity patterns of arrays)
     --no_join                  If flagged, don't join files at end of run
+    --parallel_out             If flagged, write analysis tasks and checkpoints with collective (parallel) HDF5
     --root_dir=<dir>           Root directory for output [default: ./]
     --safety=<s>               CFL safety factor [default: 0.7]
 
@@ -61,6 +63,7 @@ import logging
 import os
 import sys
 import time
+from collections import OrderedDict
 from configparser import ConfigParser
 from pathlib import Path
 from fractions import Fraction
@@ -68,18 +71,23 @@ from fractions import Fraction
 import numpy as np
 from docopt import docopt
 from mpi4py import MPI
-from pandas import DataFrame
+from scipy.fft import next_fast_len
+
+from dedalus.tools.config import config
+# Transform settings are read when dedalus.public is imported, so they must be set before it.
+config['transforms']['DEFAULT_LIBRARY']     = 'fftw'
+config['transforms-fftw']['PLANNING_RIGOR'] = 'measure'
 
 from dedalus import public as de
 from dedalus.extras import flow_tools
 from dedalus.tools  import post
-from dedalus.tools.config import config
 
 from logic.output import initialize_magnetic_output
 from logic.checkpointing import Checkpoint
 from logic.ae_tools import BoussinesqAESolver
-from logic.extras import global_noise
-from logic.parsing import construct_BC_dict, construct_out_dir
+from logic.extras import global_noise, local_noise, RollingAverage
+from logic.reductions import global_stats
+from logic.parsing import construct_BC_dict, construct_out_dir, lhs_references
 
 logger = logging.getLogger(__name__)
 
@@ -135,6 +143,10 @@ nz = int(args['--nz'])
 
 
 logger.info("Ra = {:.2e}, Pr = {:2g}, Q = {:.2e}, Pm = {:2g}, resolution = {}x{}x{}".format(Ra, Pr, Q, Pm, nx, ny, nz))
+for flag in resolution_flags:
+    n_de = int(int(args['--{}'.format(flag)])*3/2)
+    if next_fast_len(n_de) != n_de:
+        logger.warning("dealiased {} = {} is not a fast FFT length (next fast length: {})".format(flag, n_de, next_fast_len(n_de)))
 
 ### 3. Setup Dedalus domain, problem, and substitutions/parameters
 x_basis = de.Fourier( 'x', nx, interval = [-aspect/2, aspect/2], dealias=3/2)
@@ -146,33 +158,50 @@ if threeD:
     bases = [x_basis, y_basis, z_basis]
 else:
     bases = [x_basis, z_basis]
+# A real grid_dtype makes Dedalus use a real-to-complex FFT along x (only kx >= 0 is stored)
 domain = de.Domain(bases, grid_dtype=np.float64, mesh=mesh)
 
-variables = ['T1','T1_z','p','u','w','phi','Ax','Ay','Az','Bx','By','Oy', 'p_ml', 'p_ml_z', 'p_mn', 'p_mn_z', 'p_i', 'p_i_z', 'p_b', 'p_b_z', 'p_v', 'p_v_z']
+variables = ['T1','T1_z','p','u','w','phi','Ax','Ay','Az','Bx','By','Oy']
 if threeD:
     variables+=['v','Ox']
 
 problem = de.IVP(domain, variables=variables, ncc_cutoff=1e-10)
 
-Q_fd  = domain.new_field()
-Ra_fd = domain.new_field()
-Q_fd['g']  = sQ  = cQ  = Q
-Ra_fd['g'] = sRa = cRa = Ra
-
-problem.parameters['Ra'] = Ra_fd
+# The force-balance pressures are diagnostic, so they are solved in a separate LBVP (section 5)
+# only when an output needs them.  The IVP sees them as parameter fields.
+pressure_variables = ['p_ml', 'p_ml_z', 'p_mn', 'p_mn_z', 'p_i', 'p_i_z', 'p_b', 'p_b_z', 'p_v', 'p_v_z']
+pressure_fields = OrderedDict()
+for var in pressure_variables:
+    pressure_fields[var] = problem.parameters[var] = domain.new_field(name=var)
+
+# Ra and Q change while bootstrapping, so they must be fields rather than scalar parameters
+# (scalars are folded into the operator trees when the solver is built).  The fields hold
+# Ra/Pr and Q/Pr, which are the prefactors of the forcing terms, so that the RHS does not
+# divide a full grid by Pr on every evaluation.
+sQ  = cQ  = Q
+sRa = cRa = Ra
+Q_Pr_fd  = domain.new_field()
+Ra_Pr_fd = domain.new_field()
+Q_Pr_fd['g']  = Q/Pr
+Ra_Pr_fd['g'] = Ra/Pr
+
+problem.parameters['Ra_Pr'] = Ra_Pr_fd
 problem.parameters['Pr'] = Pr
 problem.parameters['Pm'] = Pm
-problem.parameters['Q']  = Q_fd
+problem.parameters['Q_Pr']  = Q_Pr_fd
 problem.parameters['pi'] = np.pi
 problem.parameters['Lx'] = problem.parameters['Ly'] = aspect
 problem.parameters['Lz'] = 1
 problem.parameters['aspect'] = aspect
+problem.parameters['ell'] = ell = aspect/10
 if not threeD:
     problem.substitutions['v']='0'
     problem.substitutions['dy(A)']='0'
     problem.substitutions['Oz']='0'
     problem.substitutions['Ox']='0'
 
+problem.substitutions['Ra']   = '(Pr*Ra_Pr)'
+problem.substitutions['Q']    = '(Pr*Q_Pr)'
 problem.substitutions['T0']   = '(-z + 0.5)'
 problem.substitutions['T0_z'] = '-1'
 problem.substitutions['Lap(A, A_z)']=       '(dx(dx(A)) + dy(dy(A)) + dz(A_z))'
@@ -206,11 +235,10 @@ problem.substitutions['enstrophy']   = '(Ox**2 + Oy**2 + Oz**2)'
 problem.substitutions['enth_flux']   = '(w*(T1+T0))'
 problem.substitutions['cond_flux']   = '(-(T1_z+T0_z)/Pr)'
 problem.substitutions['tot_flux']    = '(cond_flux+enth_flux)'
-problem.substitutions['Nu']          = '((enth_flux + cond_flux)/vol_avg(cond_flux))'
+problem.substitutions['Nu']          = '(tot_flux/vol_avg(cond_flux))'
 problem.substitutions['delta_T']     = '(left(T1+T0)-right(T1+T0))'
 problem.substitutions['vel_rms']     = 'sqrt(u**2 + v**2 + w**2)'
 problem.substitutions['vel_rms_hor'] = 'sqrt(u**2 + v**2)'
-problem.substitutions['ell']         = 'aspect/10'
 
 problem.substitutions['Ex'] = 'dx(phi) + (1/Pm)*Jx + w*By       - v*(1 + Bz)'
 problem.substitutions['Ey'] = 'dy(phi) + (1/Pm)*Jy + u*(1 + Bz) - w*Bx'
@@ -222,18 +250,18 @@ problem.substitutions['f_v_z']   = 'Kz'
 problem.substitutions['f_i_x']   = 'v*Oz - w*Oy'
 problem.substitutions['f_i_y']   = '0'
 problem.substitutions['f_i_z']   = 'u*Oy - v*Ox'
-problem.substitutions['f_ml_x']  = '(Q/Pr)*Jy'
+problem.substitutions['f_ml_x']  = 'Q_Pr*Jy'
 problem.substitutions['f_ml_y']  = '0'
-problem.substitutions['f_mn_x']  = '(Q/Pr)*(Jy*Bz - Jz*By)'
+problem.substitutions['f_mn_x']  = 'Q_Pr*(Jy*Bz - Jz*By)'
 problem.substitutions['f_mn_y']  = '0'
-problem.substitutions['f_mn_z']  = '(Q/Pr)*(Jx*By - Jy*Bx)'
-problem.substitutions['f_b']     = '(Ra/Pr)*T1'
+problem.substitutions['f_mn_z']  = 'Q_Pr*(Jx*By - Jy*Bx)'
+problem.substitutions['f_b']     = 'Ra_Pr*T1'
 
 problem.substitutions['f_v_mag']  = 'sqrt(f_v_x**2 + f_v_z**2)'
-problem.substitutions['f_ml_mag'] = 'sqrt(f_ml_x**2)'
+problem.substitutions['f_ml_mag'] = 'abs(f_ml_x)'
 problem.substitutions['f_i_mag']  = 'sqrt(f_i_x**2 + f_i_z**2)'
 problem.substitutions['f_mn_mag'] = 'sqrt(f_mn_x**2 + f_mn_z**2)'
-problem.substitutions['f_b_mag']  = 'sqrt(f_b**2)'
+problem.substitutions['f_b_mag']  = 'abs(f_b)'
 
 problem.substitutions['s_v_mag']  = 'sqrt((f_v_x  - dx(p_v) )**2 + (f_v_z  - dz(p_v) )**2)'
 problem.substitutions['s_ml_mag'] = 'sqrt((f_ml_x - dx(p_ml))**2 +          (dz(p_ml))**2)'
@@ -244,7 +272,7 @@ problem.substitutions['s_b_mag']  = 'sqrt(         (dx(p_b) )**2 + (f_b    - dz(
 
 problem.substitutions['Re']           = '( vel_rms )'
 problem.substitutions['Pe']           = '( vel_rms )'
-problem.substitutions['Re_ver']       = '( sqrt(w**2) )'
+problem.substitutions['Re_ver']       = '( abs(w) )'
 problem.substitutions['Re_hor']       = '( vel_rms_hor * ell)'
 problem.substitutions['Re_hor_full']  = '(vel_rms * ell)'
 problem.substitutions['b_mag']        = 'sqrt(Bx**2 + By**2 + Bz**2)'
@@ -277,6 +305,9 @@ eqns = (
         (threeD, "Ox - (dy(w) - dz(v)) = 0"),
         (True,   "Oy - (dz(u) - dx(w)) = 0"),
         (True,   "T1_z - dz(T1) = 0"),
+      )
+
+pressure_eqns = (
         (True,   "Lap(p_b,  p_b_z)  = Div(0,      0,      f_b)"),
         (True,   "Lap(p_ml, p_ml_z) = Div(f_ml_x, f_ml_y, 0)"),
         (True,   "Lap(p_mn, p_mn_z) = Div(f_mn_x, f_mn_y, f_mn_z)"),
@@ -326,6 +357,9 @@ bcs  = (
             (bc_dict['MC'],        " left(phi)      = 0", "True"),
             (bc_dict['MC'],        "right(phi)      = 0", else_cond),
             (bc_dict['MC'],        "right(Az)       = 0", zero_cond),
+          )
+
+pressure_bcs  = (
             (True,                 " left(dz(p_b))  =  left(f_b)",   "True"),
             (True,                 "right(dz(p_b))  = right(f_b)",   else_cond),
             (True,                 "right(p_b)      = 0",            zero_cond),
@@ -347,6 +381,12 @@ for do_bc, bc, cond in bcs:
     if do_bc:
         problem.add_bc(bc, condition=cond)
 
+# Bootstrapping rescales Ra_Pr and Q_Pr in place, which keeps the factorized LHS matrices valid
+# only if neither appears on the LHS of the problem.
+for lhs_check in [eqn for do_eqn, eqn in eqns if do_eqn] + [bc for do_bc, bc, cond in bcs if do_bc]:
+    if lhs_references(lhs_check, ['Ra_Pr', 'Q_Pr'], problem.substitutions):
+        raise ValueError("bootstrapped parameters cannot appear on the LHS: {}".format(lhs_check))
+
 ### 5. Build solver
 # Note: SBDF2 timestepper does not currently work with AE
 
@@ -362,11 +402,32 @@ cfl_safety = float(args['--safety'])
 solver = problem.build_solver(ts)
 logger.info('Solver built')
 
+pressure_problem = de.LBVP(domain, variables=pressure_variables, ncc_cutoff=1e-10)
+for k, v in problem.parameters.items():
+    if k not in pressure_variables:
+        pressure_problem.parameters[k] = v
+for var in variables:
+    pressure_problem.parameters[var] = solver.state[var]
+for k, v in problem.substitutions.items():
+    pressure_problem.substitutions[k] = v
+
+for do_eqn, eqn in pressure_eqns:
+    if do_eqn:
+        pressure_problem.add_equation(eqn)
+for do_bc, bc, cond in pressure_bcs:
+    if do_bc:
+        pressure_problem.add_bc(bc, condition=cond)
+
+pressure_solver = pressure_problem.build_solver()
+logger.info('Pressure solver built')
+
 
 ### 6. Set initial conditions: noise or loaded checkpoint
 checkpoint = Checkpoint(data_dir)
 checkpoint_min = 30
 restart = args['--restart']
+z_de = domain.grid(-1, scales=domain.dealias)
+cos_pi_z = np.ascontiguousarray(np.cos(np.pi*z_de), dtype=np.float64)
 if restart is None:
     p = solver.state['p']
     T1 = solver.state['T1']
@@ -374,13 +435,18 @@ if restart is None:
     p.set_scales(domain.dealias)
     T1.set_scales(domain.dealias)
     T1_z.set_scales(domain.dealias)
-    z_de = domain.grid(-1, scales=domain.dealias)
 
     A0 = 1e-6
 
-    #Add noise kick
-    noise = global_noise(domain, int(args['--seed']))
-    T1['g'] += A0*np.cos(np.pi*z_de)*noise['g']#/np.sqrt(Ra)
+    #Add noise kick; build A0*cos(pi z)*noise in one scratch buffer rather than two temporaries
+    if args['--local_noise']:
+        noise = local_noise(domain, int(args['--seed']), n_modes=args['--noise_modes'])
+    else:
+        noise = global_noise(domain, int(args['--seed']), n_modes=args['--noise_modes'])
+    noise_kick = np.empty_like(T1['g'])
+    np.multiply(cos_pi_z, noise['g'], out=noise_kick)
+    noise_kick *= A0#/np.sqrt(Ra)
+    T1['g'] += noise_kick
     T1.differentiate('z', out=T1_z)
 
 
@@ -390,7 +456,7 @@ else:
     logger.info("restarting from {}".format(restart))
     dt = checkpoint.restart(restart, solver)
     mode = 'append'
-checkpoint.set_checkpoint(solver, wall_dt=checkpoint_min*60, mode=mode, iter=5e3)
+checkpoint.set_checkpoint(solver, wall_dt=checkpoint_min*60, mode=mode, iter=5e3, parallel=args['--parallel_out'])
    
 
 ### 7. Set simulation stop parameters, output, and CFL
@@ -400,15 +466,15 @@ t_buoy = np.sqrt(Pr/Ra)
 f=float(args['--factor'])
 max_dt    = 0.5*np.min((t_buoy, f/Q))
 if dt is None: dt = max_dt
-analysis_tasks = initialize_magnetic_output(solver, data_dir, aspect, plot_boundaries=False, threeD=threeD, mode=mode, slice_output_dt=0.25*t_buoy, output_dt=0.1*t_buoy, out_iter=100)
+analysis_tasks = initialize_magnetic_output(solver, data_dir, aspect, plot_boundaries=False, threeD=threeD, mode=mode, slice_output_dt=0.25*t_buoy, output_dt=0.1*t_buoy, out_iter=100, parallel=args['--parallel_out'])
 
 #Add extra analysis tasks
 analysis_tasks['scalar'].add_task("1 - vol_avg(p)/vol_avg(p_i + p_b + p_v + p_mn + p_ml)", name="p_goodness")
-analysis_tasks['scalar'].add_task("vol_avg(sqrt(p_i**2))", name="p_i")
-analysis_tasks['scalar'].add_task("vol_avg(sqrt(p_b**2))", name="p_b")
-analysis_tasks['scalar'].add_task("vol_avg(sqrt(p_v**2))", name="p_v")
-analysis_tasks['scalar'].add_task("vol_avg(sqrt(p_ml**2))", name="p_ml")
-analysis_tasks['scalar'].add_task("vol_avg(sqrt(p_mn**2))", name="p_mn")
+analysis_tasks['scalar'].add_task("vol_avg(abs(p_i))", name="p_i")
+analysis_tasks['scalar'].add_task("vol_avg(abs(p_b))", name="p_b")
+analysis_tasks['scalar'].add_task("vol_avg(abs(p_v))", name="p_v")
+analysis_tasks['scalar'].add_task("vol_avg(abs(p_ml))", name="p_ml")
+analysis_tasks['scalar'].add_task("vol_avg(abs(p_mn))", name="p_mn")
 analysis_tasks['scalar'].add_task("vol_avg(s_v_mag)", name="s_v_mag")
 analysis_tasks['scalar'].add_task("vol_avg(s_i_mag)", name="s_i_mag")
 analysis_tasks['scalar'].add_task("vol_avg(s_b_mag)", name="s_b_mag")
@@ -428,23 +494,41 @@ else:
 
     
 ### 8. Setup flow tracking for terminal output, including rolling averages
-flow = flow_tools.GlobalFlowProperty(solver, cadence=1)
-flow.add_property("s_b_mag",  name='s_b_mag')
-flow.add_property("s_i_mag",  name='s_i_mag')
-flow.add_property("s_v_mag",  name='s_v_mag')
-flow.add_property("s_mn_mag", name='s_mn_mag')
-flow.add_property("s_ml_mag", name='s_ml_mag')
+# Flow properties are only read when logging, so only evaluate them on logging iterations.
+log_cadence = 10
+# Force-balance tracking for the (disabled) convergence-based bootstrap below; re-enabling it also
+# requires adding force_flow.properties to pressure_handlers.
+#force_flow = flow_tools.GlobalFlowProperty(solver, cadence=log_cadence)
+#force_flow.add_property("s_b_mag",  name='s_b_mag')
+#force_flow.add_property("s_i_mag",  name='s_i_mag')
+#force_flow.add_property("s_v_mag",  name='s_v_mag')
+#force_flow.add_property("s_mn_mag", name='s_mn_mag')
+#force_flow.add_property("s_ml_mag", name='s_ml_mag')
+
+flow = flow_tools.GlobalFlowProperty(solver, cadence=log_cadence)
 flow.add_property("Re", name='Re')
 flow.add_property("Re_ver", name='Re_ver')
 flow.add_property("Re_hor", name='Re_hor') 
-flow.add_property("Re_hor_full", name='Re_hor_full')
 flow.add_property("b_mag", name="b_mag")
-flow.add_property("sqrt(Bz**2)", name="Bz")
+flow.add_property("abs(Bz)", name="Bz")
 flow.add_property("dx(Bx) + dy(By) + dz(Bz)", name='divB')
 flow.add_property("Nu", name='Nu')
+log_properties = ['Re', 'Re_ver', 'Re_hor', 'Bz', 'b_mag', 'divB', 'Nu']
+comm = domain.dist.comm_cart
 #flow.add_property("-1 + (left(T1_z) + right(T1_z) ) / 2", name='T1_z_excess')
 #flow.add_property("T0+T1", name='T')
 
+# Solve for the force-balance pressures right before any handler that uses them is evaluated.
+pressure_handlers = [analysis_tasks['scalar']]
+evaluate_handlers = solver.evaluator.evaluate_handlers
+def evaluate_handlers_with_pressures(handlers, *args, **kwargs):
+    if any(handler in pressure_handlers for handler in handlers):
+        pressure_solver.solve()
+        for var, field in pressure_fields.items():
+            field['c'] = pressure_solver.state[var]['c']
+    evaluate_handlers(handlers, *args, **kwargs)
+solver.evaluator.evaluate_handlers = evaluate_handlers_with_pressures
+
 
 if threeD:
     Hermitian_cadence = 100
@@ -453,9 +537,7 @@ if threeD:
 u = solver.state['u']
 w = solver.state['w']
 maxN = int(4e3)
-bootstrap_force_balances = np.zeros((maxN, 4))
-rolled = np.zeros_like(bootstrap_force_balances)
-bootstrap_df = DataFrame(bootstrap_force_balances)
+bootstrap_force_balances = RollingAverage(maxN, 4)
 bootstrap_i         = 0
 last_bootstrap_time = 0
 last_bootstrap_write_time = 0
@@ -468,6 +550,8 @@ bootstrap_steps     = 0
 bootstrap_α = float(Fraction(args['--alp']))
 bootstrap_β = float(Fraction(args['--β']))
 bootstrap_logStep = float(Fraction(args['--logStep']))
+Ra_step = 10**bootstrap_logStep
+Q_step  = Ra_step**(-bootstrap_α/bootstrap_β) if bootstrap_β != 0 else 1
     
 # Main loop
 try:
@@ -493,34 +577,39 @@ try:
                     field.require_grid_space()
     
                     
-        if effective_iter % 10 == 0:
-            Re_avg = flow.grid_average('Re')
-            Re_avg_ver = flow.grid_average('Re_ver') 
-            Re_avg_hor = flow.grid_average('Re_hor') 
-            Re_avg_hor_full = flow.grid_average('Re_hor_full') 
-            log_string =  'Iteration: {:5d}, '.format(solver.iteration)
-            log_string += 'Time: {:8.3e} ({:8.3e} buoy), dt: {:8.3e}, '.format(solver.sim_time, solver.sim_time/t_buoy,  dt)
-            log_string += 'Re: {:8.3e}/{:8.3e}, '.format(Re_avg, flow.max('Re'))
-            log_string += 'Re_ver: {:8.3e}/{:8.3e}, '.format(Re_avg_ver, flow.max('Re_ver'))
-            log_string += 'Re_hor: {:8.3e}/{:8.3e}, '.format(Re_avg_hor, flow.max('Re_hor'))
-            log_string += 'Re_hor_full: {:8.3e}/{:8.3e}, '.format(Re_avg_hor_full, flow.max('Re_hor_full'))
-            log_string += 'Bz: {:8.3e}/{:8.3e}, '.format(flow.grid_average('Bz'), flow.max('Bz'))
-            log_string += 'b_mag: {:8.3e}/{:8.3e}, '.format(flow.grid_average('b_mag'), flow.max('b_mag'))
-            log_string += 'divB: {:8.3e}, '.format(flow.grid_average('divB'))
-            log_string += 'Nu: {:8.3e}, '.format(flow.grid_average('Nu'))
-            logger.info(log_string)
+        # Handlers are evaluated at the start of a step, before the iteration count is incremented.
+        if (solver.iteration - 1) % log_cadence == 0:
+            avgs, maxes = global_stats(flow, log_properties, comm)
+            Re_avg,          Re_max          = avgs['Re'],     maxes['Re']
+            Re_avg_ver,      Re_max_ver      = avgs['Re_ver'], maxes['Re_ver']
+            Re_avg_hor,      Re_max_hor      = avgs['Re_hor'], maxes['Re_hor']
+            Re_avg_hor_full, Re_max_hor_full = ell*Re_avg, ell*Re_max # Re_hor_full = Re*ell
+            Bz_avg,          Bz_max          = avgs['Bz'],     maxes['Bz']
+            b_mag_avg,       b_mag_max       = avgs['b_mag'],  maxes['b_mag']
+            divB_avg                         = avgs['divB']
+            Nu_avg = avgs['Nu']
+            # The reductions above are collective and must run on every rank; only the formatting is skipped.
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f'Iteration: {solver.iteration:5d}, '
+                            f'Time: {solver.sim_time:8.3e} ({solver.sim_time/t_buoy:8.3e} buoy), dt: {dt:8.3e}, '
+                            f'Re: {Re_avg:8.3e}/{Re_max:8.3e}, '
+                            f'Re_ver: {Re_avg_ver:8.3e}/{Re_max_ver:8.3e}, '
+                            f'Re_hor: {Re_avg_hor:8.3e}/{Re_max_hor:8.3e}, '
+                            f'Re_hor_full: {Re_avg_hor_full:8.3e}/{Re_max_hor_full:8.3e}, '
+                            f'Bz: {Bz_avg:8.3e}/{Bz_max:8.3e}, '
+                            f'b_mag: {b_mag_avg:8.3e}/{b_mag_max:8.3e}, '
+                            f'divB: {divB_avg:8.3e}, '
+                            f'Nu: {Nu_avg:8.3e}, ')
 
        # if Re_avg < 1:
        #     last_bootstrap_time = solver.sim_time
        #     last_bootstrap_write_time = solver.sim_time
        # elif (solver.sim_time - last_bootstrap_write_time > 0.5*t_buoy) and (solver.sim_time - last_bootstrap_time > bootstrap_wait_time):
        #     # Add a write every 0.5 t_ff
-       #     s_b_mag = flow.grid_average('s_b_mag')
-       #     bootstrap_force_balances[bootstrap_i,:] = (s_b_mag/flow.grid_average('s_i_mag'), s_b_mag/flow.grid_average('s_mn_mag'), s_b_mag/flow.grid_average('s_ml_mag'), s_b_mag/flow.grid_average('s_v_mag'))
+       #     s_b_mag = force_flow.grid_average('s_b_mag')
+       #     bootstrap_force_balances.add((s_b_mag/force_flow.grid_average('s_i_mag'), s_b_mag/force_flow.grid_average('s_mn_mag'), s_b_mag/force_flow.grid_average('s_ml_mag'), s_b_mag/force_flow.grid_average('s_v_mag')))
        #     if bootstrap_i >= bootstrap_min_iters:
-       #         rolled = np.array(bootstrap_df.rolling(window=maxN, min_periods=int(bootstrap_min_iters/2)).mean())
-       #         rms_chunk = rolled[bootstrap_i-int(bootstrap_min_iters/2):bootstrap_i]
-       #         rms_vals  = np.sqrt(np.mean((rms_chunk - rolled[bootstrap_i])**2/rolled[bootstrap_i]**2, axis=0))
+       #         rms_vals = bootstrap_force_balances.relative_rms(int(bootstrap_min_iters/2))
        #         logger.info('max bootstrap RMS: {:.3e}, need 0.01'.format(np.max(rms_vals)))
        #         if np.max(rms_vals) < 0.01:
        #             bootstrap_now = True
@@ -542,18 +631,19 @@ try:
                 bootstrap_now = False
                 bootstrap_steps += 1
             if bootstrap_β == 0:
-                nRa = cRa*10**(bootstrap_logStep)
+                nRa = cRa*Ra_step
                 nQ = cQ
             elif bootstrap_α == 0:
-                nQ = cQ*10**(bootstrap_logStep)
+                nQ = cQ*Ra_step
                 nRa = cRa
             else:
-                nRa = cRa*10**(bootstrap_logStep)
-                nQ = cQ/(10**(bootstrap_logStep))**(bootstrap_α/bootstrap_β)
+                nRa = cRa*Ra_step
+                nQ = cQ*Q_step
 
             logger.info('bootstrapping Ra: {:.3e}->{:.3e}, Q: {:.3e} -> {:.3e}'.format(cRa, nRa, cQ, nQ))
-            Ra_fd['g'] *= (nRa/cRa)
-            Q_fd['g']  *= (nQ/cQ)
+            # Ra and Q are uniform, so assign them rather than rescale every grid point
+            Ra_Pr_fd['g'] = nRa/Pr
+            Q_Pr_fd['g']  = nQ/Pr
 
             u_factor = np.sqrt(nRa/cRa)
             u['g'] *= u_factor
@@ -561,27 +651,18 @@ try:
 
             bootstrap_wait_time *= (cRa/nRa)
             max_dt *= (cRa/nRa)
+            # The CFL frequency tasks read the velocity fields in place, so only the dt cap needs updating.
             CFL.max_dt=max_dt
-           # CFL = flow_tools.CFL(solver, initial_dt=dt, cadence=1, safety=cfl_safety,
-           #                        max_change=1.5, min_change=0.5, max_dt=max_dt, threshold=0.1)
-            if threeD: 
-                CFL.add_velocities(('u', 'v', 'w'))
-            else: 
-                CFL.add_velocities(('u', 'w'))
 
             cQ = nQ
             cRa = nRa
 
             t_buoy = np.sqrt(Pr/cRa)
 
-            bootstrap_force_balances *= 0
-            rolled *= 0
+            bootstrap_force_balances.reset()
             bootstrap_i = 0
             last_bootstrap_time = solver.sim_time
 
-except:
-    raise
-    logger.error('Exception raised, triggering end of main loop.')
 finally:
     end_time = time.time()
     main_loop_time = end_time-start_time
@@ -593,20 +674,19 @@ finally:
     logger.info('iter/sec: {:f} (main loop only)'.format(n_iter_loop/main_loop_time))
     try:
         final_checkpoint = Checkpoint(data_dir, checkpoint_name='final_checkpoint')
-        final_checkpoint.set_checkpoint(solver, wall_dt=1, mode=mode)
+        final_checkpoint.set_checkpoint(solver, wall_dt=1, mode=mode, parallel=args['--parallel_out'])
         solver.step(dt) #clean this up in the future...works for now.
-        post.merge_process_files(data_dir+'/final_checkpoint/', cleanup=False)
-    except:
-        raise
-        print('cannot save final checkpoint')
+        if not args['--parallel_out']:
+            post.merge_process_files(data_dir+'/final_checkpoint/', cleanup=False)
     finally:
         if not args['--no_join']:
             logger.info('beginning join operation')
-            post.merge_analysis(data_dir+'checkpoint')
-
-            for key, task in analysis_tasks.items():
-                logger.info(task.base_path)
-                post.merge_analysis(task.base_path)
+            if not args['--parallel_out']:
+                # collective output is already one file per set
+                post.merge_analysis(data_dir+'checkpoint')
+                for key, task in analysis_tasks.items():
+                    logger.info(task.base_path)
+                    post.merge_analysis(task.base_path)
 
         logger.info(40*"=")
         logger.info('Iterations: {:d}'.format(n_iter_loop))
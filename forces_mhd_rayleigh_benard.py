@@ -44,6 +44,7 @@ Options:
     --no_join                  If flagged, don't join files at end of run
     --root_dir=<dir>           Root directory for output [default: ./]
     --safety=<s>               CFL safety factor [default: 0.7]
+    --CFL_cadence=<n>          Iterations between CFL timestep updates [default: 1]
 
     --noise_modes=<N>          Number of wavenumbers to use in creating noise; for resolution testing
   
@@ -60,15 +61,20 @@ import numpy as np
 from docopt import docopt
 from mpi4py import MPI
 
+from dedalus.tools.config import config
+# Transform settings are read when dedalus.public is imported, so they must be set before it.
+config['transforms']['DEFAULT_LIBRARY']     = 'fftw'
+config['transforms-fftw']['PLANNING_RIGOR'] = 'measure'
+
 from dedalus import public as de
 from dedalus.extras import flow_tools
 from dedalus.tools  import post
-from dedalus.tools.config import config
 
 from logic.output import initialize_magnetic_output
 from logic.checkpointing import Checkpoint
 from logic.ae_tools import BoussinesqAESolver
 from logic.extras import global_noise
+from logic.reductions import global_stats
 from logic.parsing import construct_BC_dict, construct_out_dir
 
 logger = logging.getLogger(__name__)
@@ -122,21 +128,34 @@ nz = int(args['--nz'])
 
 logger.info("Ra = {:.2e}, Pr = {:2g}, Q = {:.2e}, Pm = {:2g}, resolution = {}x{}x{}".format(Ra, Pr, Q, Pm, nx, ny, nz))
 
+ncpu = MPI.COMM_WORLD.size
+if mesh is None and threeD and ncpu > min(nx, ny, nz)/4:
+    # A 1D slab decomposition runs out of pencils quickly in 3D; use the most nearly square 2D mesh instead.
+    mesh_0 = int(np.sqrt(ncpu))
+    while ncpu % mesh_0:
+        mesh_0 -= 1
+    # A prime process count only factors as 1xN, which is just the slab decomposition.
+    if mesh_0 > 1:
+        mesh = [mesh_0, ncpu//mesh_0]
+        logger.info("no mesh specified; distributing over a {}x{} processor mesh".format(*mesh))
+
 ### 3. Setup Dedalus domain, problem, and substitutions/parameters
-x_basis = de.Fourier( 'x', nx, interval = [-aspect/2, aspect/2], dealias=3/2)
+Lx = Ly = aspect
+Lz = 1
+x_basis = de.Fourier( 'x', nx, interval = [-Lx/2, Lx/2], dealias=3/2)
 if threeD:
-    y_basis = de.Fourier( 'y', ny, interval = [-aspect/2, aspect/2], dealias=3/2)
+    y_basis = de.Fourier( 'y', ny, interval = [-Ly/2, Ly/2], dealias=3/2)
 
-z_basis = de.Chebyshev('z', nz, interval = [-1./2, 1./2], dealias=3/2)
+z_basis = de.Chebyshev('z', nz, interval = [-Lz/2, Lz/2], dealias=3/2)
 if threeD:
     bases = [x_basis, y_basis, z_basis]
 else:
     bases = [x_basis, z_basis]
 domain = de.Domain(bases, grid_dtype=np.float64, mesh=mesh)
 
-variables = ['T1','T1_z','p','u','w','phi','Ax','Ay','Az','Bx','By','Oy']
+variables = ['T1','T1_z','p','u','w','phi','Ax','Ay','Az','Bx','By','Bz','Jz','Oy']
 if threeD:
-    variables+=['v','Ox']
+    variables+=['v','Ox','Oz']
 
 problem = de.IVP(domain, variables=variables, ncc_cutoff=1e-10)
 
@@ -145,8 +164,9 @@ problem.parameters['Pr'] = Pr
 problem.parameters['Pm'] = Pm
 problem.parameters['Q']  = Q
 problem.parameters['pi'] = np.pi
-problem.parameters['Lx'] = problem.parameters['Ly'] = aspect
-problem.parameters['Lz'] = 1
+problem.parameters['Lx'] = Lx
+problem.parameters['Ly'] = Ly
+problem.parameters['Lz'] = Lz
 problem.parameters['aspect'] = aspect
 if not threeD:
     problem.substitutions['v']='0'
@@ -154,31 +174,39 @@ if not threeD:
     problem.substitutions['Oz']='0'
     problem.substitutions['Ox']='0'
 
-problem.substitutions['T0']   = '(-z + 0.5)'
-problem.substitutions['T0_z'] = '-1'
+# Background temperature profile, stored once as a z-only NCC
+T0_fd = domain.new_field(name='T0')
+T0_fd.meta['x']['constant'] = True
+if threeD:
+    T0_fd.meta['y']['constant'] = True
+T0_fd['g'] = -domain.grid(-1) + 0.5
+problem.parameters['T0']   = T0_fd
+problem.parameters['T0_z'] = -1
 problem.substitutions['Lap(A, A_z)']=       '(dx(dx(A)) + dy(dy(A)) + dz(A_z))'
 problem.substitutions['UdotGrad(A, A_z)'] = '(u*dx(A) + v*dy(A) + w*A_z)'
-problem.substitutions["Bz"] = "dx(Ay)-dy(Ax)"
 problem.substitutions["Jx"] = "dy(Bz)-dz(By)"
 problem.substitutions["Jy"] = "dz(Bx)-dx(Bz)"
-problem.substitutions["Jz"] = "dx(By)-dy(Bx)"
 problem.substitutions["Kz"] = "dx(Oy)-dy(Ox)"
-problem.substitutions["Oz"] = "dx(v)-dy(u)"
 problem.substitutions["Ky"] = "dz(Ox)-dx(Oz)"
 problem.substitutions["Kx"] = "dy(Oz)-dz(Oy)"
 
-#Dimensionless parameter substitutions
-problem.substitutions["inv_Re_ff"]    = "(Pr/Ra)**(1./2.)"
-problem.substitutions["inv_Rem_ff"]   = "(inv_Re_ff / Pm)"
-problem.substitutions["M_alfven"]      = "sqrt((Ra*Pm)/(Q*Pr))"
-problem.substitutions["inv_Pe_ff"]    = "(Ra*Pr)**(-1./2.)"
+#Dimensionless parameters; Ra, Pr, Pm, and Q are fixed for the run, so these are plain constants
+problem.parameters["inv_Re_ff"]    = inv_Re_ff = (Pr/Ra)**(1./2.)
+problem.parameters["inv_Rem_ff"]   = inv_Re_ff / Pm
+problem.parameters["inv_M_alfven_sq"] = (Q*Pr)/(Ra*Pm) # M_alfven**-2
+problem.parameters["inv_Pe_ff"]    = (Ra*Pr)**(-1./2.)
 
+# Fold the normalizing lengths into one multiplier per average
 if threeD:
-    problem.substitutions['plane_avg(A)'] = 'integ(A, "x", "y")/Lx/Ly'
-    problem.substitutions['vol_avg(A)']   = 'integ(A)/Lx/Ly/Lz'
+    problem.parameters['inv_area'] = 1/(Lx*Ly)
+    problem.parameters['inv_vol']  = 1/(Lx*Ly*Lz)
+    problem.substitutions['plane_avg(A)'] = 'integ(A, "x", "y")*inv_area'
+    problem.substitutions['vol_avg(A)']   = 'integ(A)*inv_vol'
 else:
-    problem.substitutions['plane_avg(A)'] = 'integ(A, "x")/Lx'
-    problem.substitutions['vol_avg(A)']   = 'integ(A)/Lx/Lz'
+    problem.parameters['inv_area'] = 1/Lx
+    problem.parameters['inv_vol']  = 1/(Lx*Lz)
+    problem.substitutions['plane_avg(A)'] = 'integ(A, "x")*inv_area'
+    problem.substitutions['vol_avg(A)']   = 'integ(A)*inv_vol'
     
 problem.substitutions['plane_std(A)'] = 'sqrt(plane_avg((A - plane_avg(A))**2))'
 #put vol avg here rms vlaues
@@ -187,23 +215,25 @@ problem.substitutions['enth_flux'] = '(w*(T1+T0))'
 problem.substitutions['cond_flux'] = '(-inv_Pe_ff*(T1_z+T0_z))'
 problem.substitutions['tot_flux'] = '(cond_flux+enth_flux)'
 problem.substitutions['momentum_rhs_z'] = '(u*Oy - v*Ox)'
-problem.substitutions['Nu'] = '((enth_flux + cond_flux)/vol_avg(cond_flux))'
+problem.substitutions['Nu'] = '(tot_flux/vol_avg(cond_flux))'
 problem.substitutions['delta_T'] = '(left(T1+T0)-right(T1+T0))'
-problem.substitutions['vel_rms'] = 'sqrt(u**2 + v**2 + w**2)'
-problem.substitutions['vel_rms_hor'] = 'sqrt(u**2 + v**2)'
-problem.substitutions['ell'] = 'aspect/10'
+problem.substitutions['vel_rms_sq'] = '(u*u + v*v + w*w)'
+problem.substitutions['vel_rms_hor_sq'] = '(u*u + v*v)'
+problem.substitutions['vel_rms'] = 'sqrt(vel_rms_sq)'
+problem.substitutions['vel_rms_hor'] = 'sqrt(vel_rms_hor_sq)'
+problem.parameters['ell'] = ell = aspect/10
 
 problem.substitutions['Ex'] = 'dx(phi) + inv_Rem_ff*Jx + w*By - v*(1 + Bz)'
 problem.substitutions['Ey'] = 'dy(phi) + inv_Rem_ff*Jy + u*(1 + Bz) - w*Bx'
 problem.substitutions['Ez'] = 'dz(phi) + inv_Rem_ff*Jz + v*Bx - u*By'
 
 problem.substitutions['f_v_x'] = 'inv_Re_ff*Kx'
-problem.substitutions['f_ml_x'] = '(M_alfven**-2)*Jy'
+problem.substitutions['f_ml_x'] = 'inv_M_alfven_sq*Jy'
 problem.substitutions['f_i_x'] = 'v*Oz - w*Oy'
-problem.substitutions['f_mn_x'] = '(M_alfven**-2)*(Jy*Bz - Jz*By)'
+problem.substitutions['f_mn_x'] = 'inv_M_alfven_sq*(Jy*Bz - Jz*By)'
 problem.substitutions['f_v_z'] = 'inv_Re_ff*Kz'
 problem.substitutions['f_i_z'] = 'u*Oy - v*Ox'
-problem.substitutions['f_mn_z'] = '(M_alfven**-2)*(Jx*By - Jy*Bx)'
+problem.substitutions['f_mn_z'] = 'inv_M_alfven_sq*(Jx*By - Jy*Bx)'
 problem.substitutions['f_b'] = 'T1'
 
 problem.substitutions['f_v_mag']='sqrt(f_v_x**2 + f_v_z**2)'
@@ -227,7 +257,7 @@ problem.add_equation("dt(T1) + w*T0_z   - inv_Pe_ff*Lap(T1, T1_z)              =
 
 problem.add_equation("dt(u)  + dx(p)   + f_v_x - f_ml_x      =    f_i_x + f_mn_x")
 if threeD:
-    problem.add_equation("dt(v)  + dy(p)   + inv_Re_ff*Ky + (M_alfven**-2)*Jx  = w*Ox - u*Oz + (M_alfven**-2)*(Jz*Bx - Jx*Bz) ")
+    problem.add_equation("dt(v)  + dy(p)   + inv_Re_ff*Ky + inv_M_alfven_sq*Jx  = w*Ox - u*Oz + inv_M_alfven_sq*(Jz*Bx - Jx*Bz) ")
 problem.add_equation("dt(w)  + dz(p)   + f_v_z                     - f_b = f_i_z + f_mn_z ")
 
 problem.add_equation("dt(Ax) + dx(phi) + inv_Rem_ff*Jx - v             = v*Bz - w*By")
@@ -239,8 +269,11 @@ problem.add_equation("dx(Ax) + dy(Ay) + dz(Az) = 0") #do I need dy here??
 
 problem.add_equation("Bx - (dy(Az) - dz(Ay)) = 0")
 problem.add_equation("By - (dz(Ax) - dx(Az)) = 0")
+problem.add_equation("Bz - (dx(Ay) - dy(Ax)) = 0")
+problem.add_equation("Jz - (dx(By) - dy(Bx)) = 0")
 if threeD:
     problem.add_equation("Ox - (dy(w) - dz(v)) = 0")
+    problem.add_equation("Oz - (dx(v) - dy(u)) = 0")
 problem.add_equation("Oy - (dz(u) - dx(w)) = 0")
 problem.add_equation("T1_z - dz(T1) = 0")
 
@@ -377,7 +410,11 @@ if restart is None:
 
     #Add noise kick
     noise = global_noise(domain, int(args['--seed']))
-    T1['g'] += A0*np.cos(np.pi*z_de)*noise['g']#/np.sqrt(Ra)
+    # Build the kick in one scratch buffer instead of chaining full-grid temporaries.
+    noise_kick = np.empty_like(T1['g'])
+    np.multiply(np.cos(np.pi*z_de), noise['g'], out=noise_kick)
+    noise_kick *= A0#/np.sqrt(Ra)
+    T1['g'] += noise_kick
     T1.differentiate('z', out=T1_z)
 
 
@@ -385,7 +422,21 @@ if restart is None:
     mode = 'overwrite'
 else:
     logger.info("restarting from {}".format(restart))
-    dt = checkpoint.restart(restart, solver)
+    # Bz, Jz, and Oz were once substitutions, so older checkpoints don't store them;
+    # rebuild them from the loaded potentials and velocities.
+    def rebuild_curl_z(solver, name, x_name, y_name):
+        """ Set state field name to dx(y_name) - dy(x_name). """
+        field = solver.state[name]
+        solver.state[y_name].differentiate('x', out=field)
+        if threeD:
+            work_field = domain.new_field()
+            solver.state[x_name].differentiate('y', out=work_field)
+            field['c'] -= work_field['c']
+    rebuild = {'Bz' : lambda solver: rebuild_curl_z(solver, 'Bz', 'Ax', 'Ay'),
+               'Jz' : lambda solver: rebuild_curl_z(solver, 'Jz', 'Bx', 'By')}
+    if threeD:
+        rebuild['Oz'] = lambda solver: rebuild_curl_z(solver, 'Oz', 'u', 'v')
+    dt = checkpoint.restart(restart, solver, rebuild=rebuild)
     mode = 'append'
 checkpoint.set_checkpoint(solver, wall_dt=checkpoint_min*60, mode=mode)
    
@@ -395,12 +446,14 @@ if run_time_buoy is not None:    solver.stop_sim_time = run_time_buoy + solver.s
 elif run_time_therm is not None: solver.stop_sim_time = run_time_therm*np.sqrt(Ra) + solver.sim_time
 else:                            solver.stop_sim_time = 1*np.sqrt(Ra) + solver.sim_time
 solver.stop_wall_time = run_time_wall*3600.
+inv_t_therm = 1/np.sqrt(Ra) # thermal time in buoyancy units is sqrt(Ra)
 max_dt    = 0.25
 if dt is None: dt = max_dt
 analysis_tasks = initialize_magnetic_output(solver, data_dir, aspect, plot_boundaries=False, threeD=threeD, mode=mode, slice_output_dt=0.25)
 
 # CFL
-CFL = flow_tools.CFL(solver, initial_dt=dt, cadence=1, safety=cfl_safety,
+# Each dt update is a global min-reduction; a longer cadence reuses the last dt in between.
+CFL = flow_tools.CFL(solver, initial_dt=dt, cadence=int(args['--CFL_cadence']), safety=cfl_safety,
                      max_change=1.5, min_change=0.5, max_dt=max_dt, threshold=0.1)
 if threeD:
     CFL.add_velocities(('u', 'v', 'w'))
@@ -408,15 +461,18 @@ else:
     CFL.add_velocities(('u', 'w'))
     
 ### 8. Setup flow tracking for terminal output, including rolling averages
-flow = flow_tools.GlobalFlowProperty(solver, cadence=1)
+# Flow properties are only read when logging, so only evaluate them on logging iterations.
+log_cadence = 10
+flow = flow_tools.GlobalFlowProperty(solver, cadence=log_cadence)
 flow.add_property("Re", name='Re')
 flow.add_property("Re_ver", name='Re_ver')
 flow.add_property("Re_hor", name='Re_hor') 
-flow.add_property("Re_hor_full", name='Re_hor_full')
 flow.add_property("b_mag", name="b_mag")
 flow.add_property("sqrt(Bz**2)", name="Bz")
 flow.add_property("dx(Bx) + dy(By) + dz(Bz)", name='divB')
 flow.add_property("Nu", name='Nu')
+log_properties = ['Re', 'Re_ver', 'Re_hor', 'Bz', 'b_mag', 'divB', 'Nu']
+comm = domain.dist.comm_cart
 #flow.add_property("-1 + (left(T1_z) + right(T1_z) ) / 2", name='T1_z_excess')
 #flow.add_property("T0+T1", name='T')
 
@@ -448,25 +504,26 @@ try:
                     field.require_grid_space()
     
                     
-        if effective_iter % 10 == 0:
-            Re_avg = flow.grid_average('Re')
-            Re_avg_ver = flow.grid_average('Re_ver') 
-            Re_avg_hor = flow.grid_average('Re_hor') 
-            Re_avg_hor_full = flow.grid_average('Re_hor_full') 
-            log_string =  'Iteration: {:5d}, '.format(solver.iteration)
-            log_string += 'Time: {:8.3e} ({:8.3e} therm), dt: {:8.3e}, '.format(solver.sim_time, solver.sim_time/np.sqrt(Ra),  dt)
-            log_string += 'Re: {:8.3e}/{:8.3e}, '.format(Re_avg, flow.max('Re'))
-            log_string += 'Re_ver: {:8.3e}/{:8.3e}, '.format(Re_avg_ver, flow.max('Re_ver'))
-            log_string += 'Re_hor: {:8.3e}/{:8.3e}, '.format(Re_avg_hor, flow.max('Re_hor'))
-            log_string += 'Re_hor_full: {:8.3e}/{:8.3e}, '.format(Re_avg_hor_full, flow.max('Re_hor_full'))
-            log_string += 'Bz: {:8.3e}/{:8.3e}, '.format(flow.grid_average('Bz'), flow.max('Bz'))
-            log_string += 'b_mag: {:8.3e}/{:8.3e}, '.format(flow.grid_average('b_mag'), flow.max('b_mag'))
-            log_string += 'divB: {:8.3e}, '.format(flow.grid_average('divB'))
-            log_string += 'Nu: {:8.3e}, '.format(flow.grid_average('Nu'))
-            logger.info(log_string)
-except:
-    raise
-    logger.error('Exception raised, triggering end of main loop.')
+        # Handlers are evaluated at the start of a step, before the iteration count is incremented.
+        if (solver.iteration - 1) % log_cadence == 0:
+            # One summed and one maxed reduction covers every logged property.
+            avgs, maxes = global_stats(flow, log_properties, comm)
+            Re_avg = avgs['Re']
+            # Re_hor_full = vel_rms*ell = Re*inv_Re_ff*ell, so it scales directly from Re.
+            Re_hor_full_avg, Re_hor_full_max = ell*inv_Re_ff*Re_avg, ell*inv_Re_ff*maxes['Re']
+            # The reductions above are collective and must run on every rank; only the formatting is skipped.
+            if logger.isEnabledFor(logging.INFO):
+                log_string =  'Iteration: {:5d}, '.format(solver.iteration)
+                log_string += 'Time: {:8.3e} ({:8.3e} therm), dt: {:8.3e}, '.format(solver.sim_time, solver.sim_time*inv_t_therm,  dt)
+                log_string += 'Re: {:8.3e}/{:8.3e}, '.format(Re_avg, maxes['Re'])
+                log_string += 'Re_ver: {:8.3e}/{:8.3e}, '.format(avgs['Re_ver'], maxes['Re_ver'])
+                log_string += 'Re_hor: {:8.3e}/{:8.3e}, '.format(avgs['Re_hor'], maxes['Re_hor'])
+                log_string += 'Re_hor_full: {:8.3e}/{:8.3e}, '.format(Re_hor_full_avg, Re_hor_full_max)
+                log_string += 'Bz: {:8.3e}/{:8.3e}, '.format(avgs['Bz'], maxes['Bz'])
+                log_string += 'b_mag: {:8.3e}/{:8.3e}, '.format(avgs['b_mag'], maxes['b_mag'])
+                log_string += 'divB: {:8.3e}, '.format(avgs['divB'])
+                log_string += 'Nu: {:8.3e}, '.format(avgs['Nu'])
+                logger.info(log_string)
 finally:
     end_time = time.time()
     main_loop_time = end_time-start_time
@@ -481,9 +538,6 @@ finally:
         final_checkpoint.set_checkpoint(solver, wall_dt=1, mode=mode)
         solver.step(dt) #clean this up in the future...works for now.
         post.merge_process_files(data_dir+'/final_checkpoint/', cleanup=False)
-    except:
-        raise
-        print('cannot save final checkpoint')
     finally:
         if not args['--no_join']:
             logger.info('beginning join operation')
@@ -62,13 +62,18 @@ class Checkpoint:
                                                             mode=mode)
         self.checkpoint.add_system(solver.state, layout = self.layout)
 
-    def restart(self, checkpoint_file, solver, cp_record=-1):
+    def restart(self, checkpoint_file, solver, cp_record=-1, rebuild=None):
         """Restart from checkpoint save file.  
 
         This file must, at present, be a single unified HDF5 file
         (e.g., if parallel=False on write-out, the data must be joined
         before restart).
 
+        Parameters
+        ----------
+        rebuild : dict, optional
+            State fields that older checkpoints may not contain, mapped to functions that
+            reconstruct them from the loaded state; each is called as rebuild[name](solver).
         """ 
         logger.info(checkpoint_file)
         f = pathlib.Path(checkpoint_file)
@@ -78,7 +83,26 @@ class Checkpoint:
             set_num = int(self.set_re.match(stem).group(1))
         except:
             raise FileNotFoundError("Output filename not as expected.")
-            
-        write, dt = solver.load_state(checkpoint_file, cp_record)
+
+        if rebuild is None:
+            rebuild = {}
+        with h5py.File(str(f), mode='r') as checkpoint_h5:
+            saved = set(checkpoint_h5['tasks'].keys())
+        missing = [field.name for field in solver.state.fields if field.name not in saved]
+        for name in missing:
+            if name not in rebuild:
+                raise KeyError("checkpoint {} has no data for state field {}".format(checkpoint_file, name))
+
+        # solver.load_state reads every field in solver.state, so hide the ones this checkpoint lacks.
+        state_fields = solver.state.fields
+        solver.state.fields = [field for field in state_fields if field.name in saved]
+        try:
+            write, dt = solver.load_state(checkpoint_file, cp_record)
+        finally:
+            solver.state.fields = state_fields
+
+        for name in missing:
+            logger.info("rebuilding {} from the loaded state".format(name))
+            rebuild[name](solver)
 
         return dt
@@ -35,14 +35,16 @@ def global_noise(domain, seed=42, n_modes=None, **kwargs):
     n_modes : int, optional
         The number of chebyshev modes to fill in the noise field.
     """
-    # Random perturbations, initialized globally for same results in parallel
+    # Random perturbations, initialized globally for same results in parallel.
+    # The generator fills arrays in C order, so each processor only needs to draw the global
+    # grid up to the end of its local block along the first axis; that prefix matches the full draw.
     gshape = domain.dist.grid_layout.global_shape(scales=1)
     slices = domain.dist.grid_layout.slices(scales=1)
     rand  = np.random.RandomState(seed=seed)
     noise_field = domain.new_field()
 
     if n_modes is None:
-        noise = rand.standard_normal(gshape)[slices]
+        noise = rand.standard_normal((slices[0].stop,) + tuple(gshape[1:]))[slices]
 
         # filter in k-space
         noise_field.set_scales(1, keep_data=False)
@@ -53,7 +55,7 @@ def global_noise(domain, seed=42, n_modes=None, **kwargs):
         scale   = n_modes/gshape[-1]
         gshape_small = domain.dist.grid_layout.global_shape(scales=scale)
         slices_small = domain.dist.grid_layout.slices(scales=scale)
-        noise = rand.standard_normal(gshape_small)[slices_small]
+        noise = rand.standard_normal((slices_small[0].stop,) + tuple(gshape_small[1:]))[slices_small]
 
         noise_field.set_scales(scale, keep_data=False)
         noise_field['g'] = noise
@@ -62,6 +64,90 @@ def global_noise(domain, seed=42, n_modes=None, **kwargs):
         
     return noise_field
 
+def local_noise(domain, seed=42, n_modes=None, **kwargs):
+    """
+    Create a field filled with random noise of order 1, drawing only the local part of the
+    grid on each processor.  Unlike global_noise, this never builds the global grid, but the
+    noise (though statistically identical) changes with the number of processors.
+
+    Arguments:
+    ----------
+    seed : int, optional
+        The seed for the random number generator; change it to get a different noise field.
+    n_modes : int, optional
+        The number of chebyshev modes to fill in the noise field.
+    """
+    rng = np.random.default_rng((seed, domain.dist.comm_cart.rank))
+    noise_field = domain.new_field()
+
+    if n_modes is None:
+        noise_field.set_scales(1, keep_data=False)
+        noise_field['g'] = rng.standard_normal(noise_field['g'].shape)
+        filter_field(noise_field, **kwargs)
+    else:
+        scale = int(n_modes)/domain.dist.grid_layout.global_shape(scales=1)[-1]
+        noise_field.set_scales(scale, keep_data=False)
+        noise_field['g'] = rng.standard_normal(noise_field['g'].shape)
+
+    noise_field.set_scales(domain.dealias, keep_data=True)
+
+    return noise_field
+
+class RollingAverage:
+    """
+    Track the rolling average of a few scalar time series.  Samples live in a fixed-length
+    ring buffer and a running sum is updated as samples enter and leave the window, so adding
+    a sample is O(1) rather than a fresh average over the full history.
+
+    Attributes:
+    -----------
+    window : int
+        The maximum number of samples in the rolling average
+    samples : NumPy array
+        Ring buffer of the most recent samples, of shape (window, n_series)
+    averages : NumPy array
+        Ring buffer of the rolling average at the time each sample was added
+    running_sum : NumPy array
+        The sum of all samples currently in the window
+    n_samples : int
+        The total number of samples added since the last reset
+    """
+
+    def __init__(self, window, n_series):
+        self.window      = int(window)
+        self.samples     = np.zeros((self.window, n_series), dtype=np.float64)
+        self.averages    = np.zeros((self.window, n_series), dtype=np.float64)
+        self.running_sum = np.zeros(n_series, dtype=np.float64)
+        self.n_samples   = 0
+
+    def add(self, values):
+        """ Add one sample to each time series, evicting the oldest sample if the window is full. """
+        i = self.n_samples % self.window
+        if self.n_samples >= self.window:
+            self.running_sum -= self.samples[i,:]
+        self.samples[i,:] = values
+        self.running_sum += self.samples[i,:]
+        self.n_samples   += 1
+        self.averages[i,:] = self.running_sum / min(self.n_samples, self.window)
 
+    def relative_rms(self, n_back):
+        """
+        The RMS relative deviation of the previous n_back rolling averages from the current one.
 
+        Arguments:
+        ----------
+        n_back : int
+            The number of previous rolling averages to compare against; must be less than both
+            the window and the number of samples added.
+        """
+        current  = self.averages[(self.n_samples - 1) % self.window,:]
+        previous = self.averages[np.arange(self.n_samples - 1 - n_back, self.n_samples - 1) % self.window,:]
+        return np.sqrt(np.mean((previous - current)**2/current**2, axis=0))
 
+    def reset(self):
+        """ Forget all samples. """
+        # fill rather than scale by zero, which would keep any nan/inf samples
+        self.samples.fill(0)
+        self.averages.fill(0)
+        self.running_sum.fill(0)
+        self.n_samples    = 0
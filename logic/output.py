@@ -10,9 +10,12 @@ logger = logging.getLogger(__name__.split('.')[-1])
 
 def initialize_output(solver, data_dir, aspect, threeD=False, volumes=False,
                       max_writes=20, output_dt=0.1, slice_output_dt=1, vol_output_dt=10, out_iter=np.inf,
-                      mode="overwrite", **kwargs):
+                      mode="overwrite", parallel=False, **kwargs):
     """
     Sets up output from runs.
+
+    If parallel is True, each handler writes one collective HDF5 file per set (requires
+    h5py built against parallel HDF5) instead of one file per process.
     """
 
     Ly = Lx = aspect
@@ -20,7 +23,7 @@ def initialize_output(solver, data_dir, aspect, threeD=False, volumes=False,
 
     # Analysis
     analysis_tasks = OrderedDict()
-    profiles = solver.evaluator.add_file_handler(data_dir+'profiles', sim_dt=output_dt, max_writes=max_writes*10, mode=mode, iter=out_iter)
+    profiles = solver.evaluator.add_file_handler(data_dir+'profiles', sim_dt=output_dt, max_writes=max_writes*10, mode=mode, parallel=parallel, iter=out_iter)
     profiles.add_task("plane_avg(T1+T0)", name="T")
     profiles.add_task("plane_avg(dz(T1+T0))", name="Tz")
     profiles.add_task("plane_avg(T1)", name="T1")
@@ -37,7 +40,7 @@ def initialize_output(solver, data_dir, aspect, threeD=False, volumes=False,
 
     analysis_tasks['profiles'] = profiles
 
-    scalar = solver.evaluator.add_file_handler(data_dir+'scalar', sim_dt=output_dt, max_writes=max_writes*100, mode=mode, iter=out_iter)
+    scalar = solver.evaluator.add_file_handler(data_dir+'scalar', sim_dt=output_dt, max_writes=max_writes*100, mode=mode, parallel=parallel, iter=out_iter)
     scalar.add_task("vol_avg(T1)", name="IE")
     scalar.add_task("vol_avg(0.5*vel_rms**2)", name="KE")
     scalar.add_task("vol_avg(T1) + vol_avg(0.5*vel_rms**2)", name="TE")
@@ -63,7 +66,7 @@ def initialize_output(solver, data_dir, aspect, threeD=False, volumes=False,
 
     if threeD:
         #Analysis
-        slices = solver.evaluator.add_file_handler(data_dir+'slices', sim_dt=slice_output_dt, max_writes=max_writes, mode=mode, iter=out_iter*(slice_output_dt/output_dt))
+        slices = solver.evaluator.add_file_handler(data_dir+'slices', sim_dt=slice_output_dt, max_writes=max_writes, mode=mode, parallel=parallel, iter=out_iter*(slice_output_dt/output_dt))
         slices.add_task("interp(T1 + T0,         y={})".format(0), name='T')
         slices.add_task("interp(T1 + T0,         z={})".format(0.49), name='T near top')
         slices.add_task("interp(T1 + T0,         z={})".format(-0.49), name='T near bot 1')
@@ -88,13 +91,13 @@ def initialize_output(solver, data_dir, aspect, threeD=False, volumes=False,
         analysis_tasks['scalar'].add_task("vol_avg(v)",  name="v")
 
         if volumes:
-            analysis_volume = solver.evaluator.add_file_handler(data_dir+'volumes', sim_dt=vol_output_dt, max_writes=5, mode=mode, iter=out_iter)
+            analysis_volume = solver.evaluator.add_file_handler(data_dir+'volumes', sim_dt=vol_output_dt, max_writes=5, mode=mode, parallel=parallel, iter=out_iter)
             analysis_volume.add_task("T1 + T0", name="T")
             analysis_volume.add_task("w*(T1 + T0)", name="wT")
             analysis_tasks['volumes'] = analysis_volume
     else:
         # Analysis
-        slices = solver.evaluator.add_file_handler(data_dir+'slices', sim_dt=slice_output_dt, max_writes=max_writes, mode=mode, iter=out_iter*(slice_output_dt/output_dt))
+        slices = solver.evaluator.add_file_handler(data_dir+'slices', sim_dt=slice_output_dt, max_writes=max_writes, mode=mode, parallel=parallel, iter=out_iter*(slice_output_dt/output_dt))
         slices.add_task("T1 + T0", name='T')
         slices.add_task("T1")
         slices.add_task("u")
@@ -106,7 +109,7 @@ def initialize_output(solver, data_dir, aspect, threeD=False, volumes=False,
         #slices.add_task("-2*R*(dz(Oy)**2 + dx(Oy)**2)", name="enstrophy_visc_source")
         analysis_tasks['slices'] = slices
 
-        powers = solver.evaluator.add_file_handler(data_dir+'powers', sim_dt=slice_output_dt, max_writes=max_writes*10, mode=mode, iter=out_iter*(slice_output_dt/output_dt))
+        powers = solver.evaluator.add_file_handler(data_dir+'powers', sim_dt=slice_output_dt, max_writes=max_writes*10, mode=mode, parallel=parallel, iter=out_iter*(slice_output_dt/output_dt))
         powers.add_task("interp(T1,         z={})".format(0),    name='T midplane', layout='c')
         powers.add_task("interp(T1,         z={})".format(-0.49), name='T near bot', layout='c')
         powers.add_task("interp(T1,         z={})".format(0.49), name='T near top', layout='c')
@@ -1,4 +1,5 @@
 from fractions import Fraction
+import re
 import sys
 import os
 from collections import OrderedDict
@@ -141,3 +142,34 @@ def construct_out_dir(args_dict, bc_dict, base_flags=['3D', 'Ra', 'Pr', 'a'], fr
             os.mkdir(logdir)
     return data_dir
 
+
+def lhs_references(equation, names, substitutions=None):
+    """
+    Determine whether the left-hand side of a dedalus equation string depends on any of
+    the given names, expanding substitutions recursively.
+
+    # Arguments
+        equation (str) :
+            The equation or boundary condition string, e.g. "dt(u) + dx(p) = f"
+        names (list) :
+            The parameter or variable names to look for
+        substitutions (dict, optional) :
+            The problem's substitutions, keyed by name or function signature (e.g. "Lap(A, A_z)")
+
+    # Returns
+        bool :
+            True if the LHS references any of names
+    """
+    if substitutions is None:
+        substitutions = {}
+    subs = {k.split('(')[0].strip() : v for k, v in substitutions.items()}
+    tokens = re.findall(r'[A-Za-z_]\w*', equation.split('=')[0])
+    seen = set()
+    while len(tokens) > 0:
+        token = tokens.pop()
+        if token in names:
+            return True
+        if token in subs and token not in seen:
+            seen.add(token)
+            tokens += re.findall(r'[A-Za-z_]\w*', subs[token])
+    return False
@@ -0,0 +1,55 @@
+"""
+    Global reductions of flow properties for terminal output.  The local statistics
+    of a grid array are gathered together so that all logged properties share a
+    minimal number of MPI reductions, rather than one per statistic.
+"""
+from collections import OrderedDict
+
+import numpy as np
+from mpi4py import MPI
+
+def local_stats(data):
+    """
+    Compute the local sum, maximum, and number of points of a grid data array.
+
+    Arguments:
+    ----------
+    data : NumPy array
+        The local (processor) grid data of a field.
+
+    Returns:
+    --------
+    tuple : (sum, max, size) of the local data.  Empty arrays return (0, -inf, 0).
+    """
+    if data.size == 0:
+        return 0., -np.inf, 0
+    return np.sum(data), np.max(data), data.size
+
+def global_stats(flow, names, comm=MPI.COMM_WORLD):
+    """
+    Compute the grid averages and maxima of a list of flow properties in two MPI reductions.
+
+    Arguments:
+    ----------
+    flow : Dedalus GlobalFlowProperty
+        The flow tracker in which the properties are registered
+    names : list of str
+        The names of the properties
+    comm : MPI communicator, optional
+        The communicator to reduce over (default: MPI.COMM_WORLD)
+
+    Returns:
+    --------
+    tuple : (avgs, maxes), OrderedDicts of the grid average and maximum of each property
+            over the global grid, keyed by property name.
+    """
+    n_props = len(names)
+    sums  = np.zeros(2*n_props, dtype=np.float64)
+    maxes = np.zeros(n_props,   dtype=np.float64)
+    for i, name in enumerate(names):
+        sums[i], maxes[i], sums[n_props+i] = local_stats(flow.properties[name]['g'])
+    comm.Allreduce(MPI.IN_PLACE, sums,  op=MPI.SUM)
+    comm.Allreduce(MPI.IN_PLACE, maxes, op=MPI.MAX)
+    avgs = OrderedDict((name, sums[i]/sums[n_props+i]) for i, name in enumerate(names))
+    maxs = OrderedDict((name, maxes[i])                for i, name in enumerate(names))
+    return avgs, maxs
@@ -0,0 +1,39 @@
+import numpy as np
+
+from logic.extras import RollingAverage
+
+def test_rolling_average_reset_clears_nonfinite_samples():
+    avg = RollingAverage(4, 2)
+    avg.add((np.nan, np.inf))
+    avg.reset()
+    avg.add((1, 2))
+    assert avg.n_samples == 1
+    assert np.array_equal(avg.running_sum, (1, 2))
+    assert np.array_equal(avg.averages[0,:], (1, 2))
+    assert np.all(np.isfinite(avg.samples))
+
+def rolling_means(data, window):
+    """ The trailing rolling mean of each row of data, over up to window rows. """
+    return np.array([np.mean(data[max(0, i-window+1):i+1], axis=0) for i in range(len(data))])
+
+def test_rolling_average_evicts_past_window():
+    data = np.arange(10, dtype=np.float64).reshape(5, 2)
+    avg = RollingAverage(3, 2)
+    for values in data:
+        avg.add(values)
+    assert avg.n_samples == 5
+    assert np.allclose(avg.running_sum, np.sum(data[-3:], axis=0))
+    rolled = rolling_means(data, 3)
+    for i in range(2, 5):
+        assert np.allclose(avg.averages[i % 3,:], rolled[i])
+
+def test_rolling_average_relative_rms():
+    data = np.random.RandomState(42).uniform(1, 2, size=(10, 2))
+    window, n_back = 4, 3
+    avg = RollingAverage(window, 2)
+    for values in data:
+        avg.add(values)
+    rolled = rolling_means(data, window)
+    i = len(data) - 1
+    expected = np.sqrt(np.mean((rolled[i-n_back:i] - rolled[i])**2/rolled[i]**2, axis=0))
+    assert np.allclose(avg.relative_rms(n_back), expected)
@@ -0,0 +1,17 @@
+from logic.parsing import lhs_references
+
+def test_lhs_references_direct():
+    assert lhs_references("dt(w) - Ra_Pr*T1 = 0", ['Ra_Pr'])
+
+def test_lhs_references_nested_substitutions():
+    substitutions = {'f_b' : 'buoy', 'buoy' : '(Ra_Pr*T1)'}
+    assert lhs_references("dt(w) + dz(p) - f_b = 0", ['Ra_Pr'], substitutions)
+
+def test_lhs_references_function_substitution():
+    substitutions = {'Lap(A, A_z)' : '(Q_Pr*(dx(dx(A)) + dz(A_z)))'}
+    assert lhs_references("dt(T1) - Lap(T1, T1_z) = 0", ['Q_Pr'], substitutions)
+
+def test_lhs_references_rhs_only():
+    substitutions = {'f_b' : '(Ra_Pr*T1)'}
+    assert not lhs_references("dt(w) + dz(p) = f_b", ['Ra_Pr'], substitutions)
+    assert not lhs_references("dt(w) + dz(p) = Ra_Pr*T1", ['Ra_Pr'])
@@ -0,0 +1,22 @@
+import numpy as np
+from mpi4py import MPI
+
+from logic.reductions import local_stats, global_stats
+
+class StubFlow:
+    """ Mimics GlobalFlowProperty.properties[name]['g'] for fixed grid data. """
+    def __init__(self, **data):
+        self.properties = {name : {'g' : np.asarray(values, dtype=np.float64)} for name, values in data.items()}
+
+def test_local_stats():
+    assert local_stats(np.array([[1., 2.], [3., 6.]])) == (12., 6., 4)
+
+def test_local_stats_empty():
+    assert local_stats(np.zeros((0, 4))) == (0., -np.inf, 0)
+
+def test_global_stats():
+    flow = StubFlow(Re=[[1., 2.], [3., 6.]], Nu=[-1., -3.])
+    avgs, maxes = global_stats(flow, ['Re', 'Nu'], MPI.COMM_SELF)
+    assert list(avgs.keys()) == list(maxes.keys()) == ['Re', 'Nu']
+    assert avgs['Re'] == 3. and maxes['Re'] == 6.
+    assert avgs['Nu'] == -2. and maxes['Nu'] == -1.